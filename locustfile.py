@@ -13,19 +13,24 @@
  * See the License for the specific language governing permissions and
  * limitations under the License.
  */
+import argparse
 import re
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+from itertools import accumulate
 
-from locust import FastHttpUser, task, between, events
+from locust import FastHttpUser, task, constant, events
 import m3u8
 import random
 import gevent
-from gevent.lock import BoundedSemaphore
-from gevent.queue import Queue
-from urllib.parse import urlparse, parse_qs, urlencode, urljoin
+from gevent import ssl
+from gevent.lock import BoundedSemaphore, RLock
+from gevent.pool import Pool
+from gevent.threadpool import ThreadPool
+from urllib.parse import urlparse, parse_qs, quote_plus, urljoin
 import logging
-if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
-    from gevent import monkey
-    monkey.patch_all()
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +38,47 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S',
 )
 
+# Quoted PROGRAM-ID attribute that the m3u8 library fails to parse
+_PROGRAM_ID_PATTERN = re.compile(r'PROGRAM-ID="(\d+)"')
+
+# Chunk size for reading full segments, the data is dropped as soon as it is read
+_SEGMENT_READ_CHUNK_SIZE = 65536
+
+# Native threads for playlist parsing
+_PARSE_POOL_SIZE = 4
+_parse_pool = None
+
+# TLS context shared by all users in the process
+_ssl_context = None
+
+# Variant playlists shared between users with --share-playlist-fetch:
+# playlist URL -> (expiry time, parsed playlist, ETag, Last-Modified), expired entries are evicted on refresh
+_PLAYLIST_CACHE = {}
+# Per playlist URL locks, so only one user refreshes a shared playlist at a time
+_PLAYLIST_LOCKS = {}
+# Expired shared playlists are swept at most once per interval, in seconds
+_PLAYLIST_EVICTION_INTERVAL = 10
+_next_playlist_eviction = 0
+
+
+def _positive_int(value):
+    """
+    Argument type for options that must be a positive integer.
+
+    Args:
+        value: Option value from the command line or environment
+
+    Returns:
+        The value as an int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
 
 # Add custom command-line arguments
 @events.init_command_line_parser.add_listener
@@ -58,25 +104,150 @@ def _(parser):
                         action="store_true",
                         default=False,
                         env_var="DOWNLOAD_FULL_SEGMENTS",
-                        help="Download full segment content instead of just the first few bytes.")
+                        help="Download full segment content instead of just the first --partial-segment-bytes bytes.")
+    parser.add_argument("--partial-segment-bytes", type=_positive_int,
+                        default=65536,
+                        env_var="PARTIAL_SEGMENT_BYTES",
+                        help="Number of bytes requested from each segment when full segment download is disabled.")
+    parser.add_argument("--segment-fetch-concurrency", type=_positive_int,
+                        default=4,
+                        env_var="SEGMENT_FETCH_CONCURRENCY",
+                        help="Maximum number of segments downloaded in parallel by each user.")
+    parser.add_argument("--share-playlist-fetch",
+                        action="store_true",
+                        default=False,
+                        env_var="SHARE_PLAYLIST_FETCH",
+                        help="Share variant playlist requests between users playing the same playlist, so most of the load goes to segments. "
+                             "Users with a sessionid always poll the playlist themselves, so the origin keeps their session alive.")
+
+
+# Create per-process shared state
+@events.init.add_listener
+def _(environment, **kwargs):
+    # Locust imports the locustfile before forking --processes workers and fires init
+    # in every process afterwards, so threads and TLS state are never inherited across a fork
+    global _parse_pool, _ssl_context
+    _parse_pool = ThreadPool(_PARSE_POOL_SIZE)
+    _ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    _ssl_context.check_hostname = False
+    _ssl_context.verify_mode = ssl.CERT_NONE
+
+
+def _append_query(url, query):
+    """
+    Append an encoded query parameter to a URL without parsing the whole URL.
+    HLS URIs are simple enough that finding the query and fragment separators is sufficient.
+
+    Args:
+        url: Absolute URL or relative reference
+        query: Encoded 'name=value' pair
+
+    Returns:
+        URL with the parameter added to its query string
+    """
+    fragment_start = url.find('#')
+    if fragment_start != -1:
+        return _append_query(url[:fragment_start], query) + url[fragment_start:]
+    if '?' not in url:
+        return f"{url}?{query}"
+    if url.endswith(('?', '&')):
+        return url + query
+    return f"{url}&{query}"
+
+
+def _shared_ssl_context(**kwargs):
+    """
+    SSL context factory for FastHttpUser that hands the same context to every user.
+    Certificates are not verified during load tests, so the CA bundle offered by
+    geventhttpclient is ignored instead of being loaded for each user's connection pool.
+
+    Args:
+        **kwargs: Arguments passed by geventhttpclient (e.g. cafile), unused
+
+    Returns:
+        Shared SSLContext instance
+    """
+    return _ssl_context
+
+
+def _parse_m3u8(playlist_text):
+    """
+    Parse playlist text with the m3u8 library in a native thread.
+    The calling greenlet waits for the result while the gevent hub keeps serving
+    other greenlets, instead of being blocked for the whole parse.
+
+    Args:
+        playlist_text: The text content of the playlist
+
+    Returns:
+        Parsed m3u8.M3U8 object
+    """
+    return _parse_pool.apply(m3u8.loads, (playlist_text,))
+
+
+@lru_cache(maxsize=256)
+def _parse_media_playlist(playlist_text):
+    """
+    Parse a media playlist into a lightweight structure.
+    Results are cached, so users sharing the same playlist body parse it only once.
+
+    Args:
+        playlist_text: The text content of the media playlist
+
+    Returns:
+        Tuple of (segments, media_sequence, is_endlist, playlist_type, target_duration),
+        where segments is a tuple of (uri, duration) pairs
+    """
+    playlist = _parse_m3u8(playlist_text)
+    segments = tuple((segment.uri, segment.duration) for segment in playlist.segments)
+    return segments, playlist.media_sequence, playlist.is_endlist, playlist.playlist_type, playlist.target_duration
+
+
+def _evict_expired_playlists(now):
+    """
+    Drop expired shared playlists and the locks nobody holds for them,
+    so playlists with per-user URLs don't pile up for every spawned user.
+    The sweep runs at most once per _PLAYLIST_EVICTION_INTERVAL, so refreshes
+    don't scan every entry when each user has its own playlist URL.
+    A lock dropped while a user is about to take it only costs one extra refresh.
+
+    Args:
+        now: Current time.monotonic() value
+    """
+    global _next_playlist_eviction
+    if now < _next_playlist_eviction:
+        return
+    _next_playlist_eviction = now + _PLAYLIST_EVICTION_INTERVAL
+    for key in [key for key, cached in _PLAYLIST_CACHE.items() if cached[0] <= now]:
+        del _PLAYLIST_CACHE[key]
+    for key in [key for key, lock in _PLAYLIST_LOCKS.items() if key not in _PLAYLIST_CACHE and not lock.locked()]:
+        del _PLAYLIST_LOCKS[key]
+
 
 class HLSUser(FastHttpUser):
     """
     User class that simulates an HLS player client.
     Uses FastHttpUser for better performance during load testing.
     """
-    wait_time = between(1, 3)  # Time between tasks
+    wait_time = constant(60)   # Time between tasks, the task itself does no work
     connection_timeout = 5     # Connection timeout in seconds
     network_timeout = 5        # Network timeout in seconds
+    insecure = True            # Skip certificate verification
+    ssl_context_factory = staticmethod(_shared_ssl_context)  # One TLS context for all users
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, environment, *args, **kwargs):
         # Set default host if not provided
         self.host = self.host or "https://moments.example.com"
-        super().__init__(*args, **kwargs)
+        # Size the connection pool for parallel segment downloads plus the playlist request,
+        # FastHttpSession reads it on construction
+        self.concurrency = environment.parsed_options.segment_fetch_concurrency + 1
+        super().__init__(environment, *args, **kwargs)
+        # Random generator of this user, seeded from the OS
+        self.rng = random.Random()
         try:
             # Parse master URL(s) and choose one randomly if multiple are provided
             urls_list = [url.strip() for url in self.environment.parsed_options.master_url.replace('"', '').split(',')]
-            self.master_url = random.choice(urls_list)
+            self.master_url = self.rng.choice(urls_list)
         except (ValueError, IndexError):
             self.master_url = "WRONG_URL"
 
@@ -87,24 +258,46 @@ class HLSUser(FastHttpUser):
         """
         # Initialize user session variables
         self.sessionid = None              # Session ID for stateful connections
+        self.sessionid_suffix = None       # Precomputed 'sessionid=...' query parameter
         self.selected_variant = None       # Selected HLS variant
         self.playlist_uri = None           # URI of the selected variant playlist
+        self.playlist_key = None           # Variant playlist URL without sessionid, used for shared fetches
+        self.playlist_base = None          # Directory of the variant playlist for relative segment URIs
+        self.playlist_origin = None        # Scheme and host of the variant playlist for absolute-path segment URIs
+        self.playlist_cache = None         # Last parsed variant playlist
+        self.playlist_etag = None          # ETag of the last variant playlist response
+        self.playlist_last_modified = None  # Last-Modified of the last variant playlist response
         self.playback_position = 0         # Current playback position in seconds
-        self.segment_queue = Queue()       # Queue for segments to download
+        self.segment_queue = deque()       # Queue for segments to download
+        self.queued_uris = set()           # URIs queued or being downloaded
+        self.fetch_pool = Pool(self.environment.parsed_options.segment_fetch_concurrency)  # Parallel segment downloads
         self.semaphore = BoundedSemaphore(1)  # Semaphore for thread synchronization
         self.buffer_duration = self.environment.parsed_options.vod_buffer_duration or 40  # Fixed buffer size for VOD
         self.buffered_duration = 0         # Current buffer level in seconds
+        self.pending_duration = 0          # Duration of segments being downloaded
         self.last_downloaded_sequence = None  # Last downloaded segment sequence number
         self.stream_type = None            # Stream type: 'LIVE' or 'VOD'
         self.switch_interval = self.environment.parsed_options.vod_switch_interval or 300  # Interval for random position switch
         self.playlist_segments = []        # List of segments for VOD
+        self.cumulative_durations = []     # Running total of segment durations for VOD
         self.total_segments = 0            # Total number of segments in VOD
         self.current_segment_index = 0     # Current segment index for VOD
+        self.last_added_sequence = -1      # Last segment index added to the queue for VOD
+        self.average_segment_duration = 0  # Average segment duration for VOD
+        self.prefetch_window = 4           # Segments queued ahead of the buffer for VOD
         # Initialize the filtering settings
         self.filter_host_segments = self.environment.parsed_options.filter_host_segments
         self.download_full_segments = self.environment.parsed_options.download_full_segments
+        self.share_playlist_fetch = self.environment.parsed_options.share_playlist_fetch
+        # Prepare segment request headers based on download mode,
+        # segments are already compressed so ask for them as-is
+        self.segment_headers = {'Accept-Encoding': 'identity'}
+        if not self.download_full_segments:
+            partial_segment_bytes = self.environment.parsed_options.partial_segment_bytes
+            self.segment_headers['Range'] = f"bytes=0-{partial_segment_bytes - 1}"
 
         self.running = True                # Flag indicating if user is active
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)  # Guards debug logging on hot paths
         self.greenlets = []                # List of running greenlets (background tasks)
 
         logging.debug("Starting HLS playback")
@@ -120,6 +313,8 @@ class HLSUser(FastHttpUser):
         # Stop all background greenlets
         for greenlet in self.greenlets:
             greenlet.kill()
+        # Abort segment downloads in flight
+        self.fetch_pool.kill()
 
     def fix_master_quotes(self, master_text):
         """
@@ -132,8 +327,10 @@ class HLSUser(FastHttpUser):
         Returns:
             Fixed playlist text
         """
-        pattern = r'PROGRAM-ID="(\d+)"'
-        return re.sub(pattern, r'PROGRAM-ID=\1', master_text)
+        # Well-formed playlists have nothing to fix
+        if 'PROGRAM-ID="' not in master_text:
+            return master_text
+        return _PROGRAM_ID_PATTERN.sub(r'PROGRAM-ID=\1', master_text)
 
     def start_hls_playback(self):
         """
@@ -157,45 +354,44 @@ class HLSUser(FastHttpUser):
                     parsed_url = urlparse(redirect_url)
                     query_params = parse_qs(parsed_url.query)
                     self.sessionid = query_params.get('sessionid', [None])[0]
+                    if self.sessionid:
+                        self.sessionid_suffix = f"sessionid={quote_plus(self.sessionid)}"
 
                     # Request master playlist with sessionid
                     master_response = self.client.get(redirect_url, headers=headers,
                                                       name=f"GET master-session.m3u8")
-                    master_playlist = m3u8.loads(self.fix_master_quotes(master_response.text))
+                    master_text = self.fix_master_quotes(master_response.text)
                 else:
                     logging.error("Location header not found in 302 response.")
                     return
             elif response.status_code == 200:
                 # Direct response with the master playlist
-                master_playlist = m3u8.loads(self.fix_master_quotes(response.text))
+                master_text = self.fix_master_quotes(response.text)
                 logging.debug("Server returned master playlist without redirection.")
             else:
                 logging.error(f"Unexpected status code {response.status_code}")
                 return
 
+            master_playlist = _parse_m3u8(master_text)
+
             # Check if the playlist contains variants (master playlist) or segments (media playlist)
             if master_playlist.playlists:
                 logging.debug("Master playlist with variants detected.")
-                # Logic to select a variant playlist
-                variants_with_resolution = []
-
-                # Find variants with 720p resolution
+                # Select the variant with the highest bandwidth among 720p variants
+                # in a single pass over the variants
+                best_bandwidth = -1
                 for playlist in master_playlist.playlists:
                     stream_info = playlist.stream_info
-                    resolution = stream_info.resolution
-                    if resolution == (1280, 720):
-                        variants_with_resolution.append(playlist)
-
-                # Select the variant with the highest bandwidth among 720p variants,
-                # or a random variant if no 720p is available
-                if variants_with_resolution:
-                    self.selected_variant = max(
-                        variants_with_resolution,
-                        key=lambda p: int(p.stream_info.bandwidth or 0)
-                    )
-                else:
+                    if stream_info.resolution == (1280, 720):
+                        bandwidth = int(stream_info.bandwidth or 0)
+                        if bandwidth > best_bandwidth:
+                            best_bandwidth = bandwidth
+                            self.selected_variant = playlist
+
+                # Or a random variant if no 720p is available
+                if self.selected_variant is None:
                     if master_playlist.playlists:
-                        self.selected_variant = random.choice(master_playlist.playlists)
+                        self.selected_variant = self.rng.choice(master_playlist.playlists)
                     else:
                         logging.error("Could not find variants in master playlist.")
                         return
@@ -203,39 +399,41 @@ class HLSUser(FastHttpUser):
                 # Save playlist URI
                 self.playlist_uri = self.selected_variant.uri
 
-                # Add sessionid to playlist_uri if needed
-                if self.sessionid and 'sessionid' not in self.playlist_uri:
-                    parsed_uri = urlparse(self.playlist_uri)
-                    query_params = parse_qs(parsed_uri.query)
-                    query_params['sessionid'] = self.sessionid
-                    new_query = urlencode(query_params, doseq=True)
-                    self.playlist_uri = parsed_uri._replace(query=new_query).geturl()
-
                 # Convert relative path to full URL
                 if not self.playlist_uri.startswith('http'):
                     self.playlist_uri = urljoin(self.host, self.playlist_uri)
+                self.playlist_key = self.playlist_uri
+
+                # Add sessionid to playlist_uri if needed
+                if self.sessionid_suffix and 'sessionid' not in self.playlist_uri:
+                    self.playlist_uri = _append_query(self.playlist_uri, self.sessionid_suffix)
 
                 logging.debug(f"Selected playlist: {self.playlist_uri}")
 
                 # Request the selected variant playlist
-                playlist_response = self.client.get(self.playlist_uri,
-                                                    name=f"GET stream.m3u8")
-                if playlist_response.status_code != 200:
-                    logging.error(f"Error getting playlist: status code {playlist_response.status_code}")
+                variant_playlist = self.fetch_variant_playlist()
+                if not variant_playlist:
                     return
-
-                variant_playlist = m3u8.loads(playlist_response.text)
             elif master_playlist.segments:
                 logging.debug("Media playlist with segments detected.")
                 # If the playlist already contains segments, treat it as variant_playlist
-                variant_playlist = master_playlist
+                variant_playlist = _parse_media_playlist(master_text)
+                self.playlist_cache = variant_playlist
                 self.playlist_uri = master_url  # Playlist already loaded
+                self.playlist_key = master_url
             else:
                 logging.error("Playlist contains neither variants nor segments.")
                 return
 
+            # Directory of the variant playlist, segment URIs are usually relative to it
+            self.playlist_base = self.playlist_uri.split('?', 1)[0].rsplit('/', 1)[0] + '/'
+            parsed_playlist_uri = urlparse(self.playlist_uri)
+            self.playlist_origin = f"{parsed_playlist_uri.scheme}://{parsed_playlist_uri.netloc}" if parsed_playlist_uri.netloc else ''
+
+            segments, _, is_endlist, playlist_type, _ = variant_playlist
+
             # Determine stream type
-            if variant_playlist.is_endlist or variant_playlist.playlist_type == 'vod':
+            if is_endlist or playlist_type == 'vod':
                 self.stream_type = 'VOD'
                 logging.debug("VOD stream detected")
             else:
@@ -250,26 +448,100 @@ class HLSUser(FastHttpUser):
                 self.greenlets.append(gevent.spawn(self.update_playlist))
             elif self.stream_type == 'VOD':
                 # Save segments for VOD
-                self.playlist_segments = variant_playlist.segments
+                self.playlist_segments = segments
                 self.total_segments = len(self.playlist_segments)
+                self.cumulative_durations = list(accumulate(duration for _, duration in segments))
+                if self.total_segments:
+                    self.average_segment_duration = self.cumulative_durations[-1] / self.total_segments
+                if self.average_segment_duration > 0:
+                    self.prefetch_window = max(4, int(self.buffer_duration // self.average_segment_duration))
                 # Start random segment switching loop (if enabled)
                 if self.switch_interval > 0:
                     self.greenlets.append(gevent.spawn(self.switch_random_segment_loop))
                 # Initialize playback from first segment
                 self.current_segment_index = 0
                 self.buffered_duration = 0
-                self.segment_queue = Queue()
+                self.segment_queue.clear()
+                self.queued_uris.clear()
                 self.last_downloaded_sequence = self.current_segment_index - 1
+                self.last_added_sequence = self.current_segment_index - 1
                 # Fill buffer for VOD starting from the first segment
                 self.add_segments_to_queue_for_vod()
 
         except Exception as e:
             logging.error(f"Error in start_hls_playback: {e}")
 
+    def fetch_variant_playlist(self):
+        """
+        Get the current variant playlist.
+        With share_playlist_fetch enabled, users playing the same playlist share
+        one request per half target duration, the others reuse its result.
+        Users with a sessionid are not shared, a shared request would carry the
+        sessionid of one user only and let the origin expire the other sessions.
+
+        Returns:
+            Parsed playlist tuple, or None if the request failed
+        """
+        if not self.share_playlist_fetch or self.sessionid_suffix:
+            return self.request_variant_playlist()
+
+        # Users arriving while the playlist is being refreshed wait for that refresh
+        lock = _PLAYLIST_LOCKS.get(self.playlist_key)
+        if lock is None:
+            lock = _PLAYLIST_LOCKS[self.playlist_key] = RLock()
+        with lock:
+            cached = _PLAYLIST_CACHE.get(self.playlist_key)
+            if cached and time.monotonic() < cached[0]:
+                # Adopt the shared copy as if this user had fetched it
+                self.playlist_cache, self.playlist_etag, self.playlist_last_modified = cached[1:]
+                return self.playlist_cache
+
+            variant_playlist = self.request_variant_playlist()
+            if variant_playlist:
+                now = time.monotonic()
+                _evict_expired_playlists(now)
+                target_duration = variant_playlist[4] or 10
+                _PLAYLIST_CACHE[self.playlist_key] = (now + target_duration / 2, variant_playlist,
+                                                      self.playlist_etag, self.playlist_last_modified)
+            return variant_playlist
+
+    def request_variant_playlist(self):
+        """
+        Request and parse the variant playlist.
+        Validators from the previous response are sent along, so an unchanged
+        playlist costs a 304 and its parsed structure is reused.
+
+        Returns:
+            Parsed playlist tuple, or None if the request failed
+        """
+        headers = {}
+        if self.playlist_etag:
+            headers['If-None-Match'] = self.playlist_etag
+        if self.playlist_last_modified:
+            headers['If-Modified-Since'] = self.playlist_last_modified
+        playlist_response = self.client.get(
+            self.playlist_uri,
+            headers=headers,
+            name=f"GET stream.m3u8"
+        )
+        if playlist_response.status_code == 304 and self.playlist_cache:
+            # Playlist not modified, reuse the parsed structure
+            return self.playlist_cache
+        if playlist_response.status_code != 200:
+            logging.error(f"Error getting playlist: status code {playlist_response.status_code}")
+            return None
+
+        self.playlist_cache = _parse_media_playlist(playlist_response.text)
+        self.playlist_etag = playlist_response.headers.get('ETag')
+        self.playlist_last_modified = playlist_response.headers.get('Last-Modified')
+        return self.playlist_cache
+
     @task
     def hls_task(self):
-        """Empty task for Locust. The actual work is done in background tasks."""
-        gevent.sleep(1)
+        """
+        Empty task for Locust. The actual work is done in background tasks.
+        The user idles in wait_time rather than here, so it can be stopped at once.
+        """
 
     def switch_random_segment_loop(self):
         """
@@ -302,10 +574,14 @@ class HLSUser(FastHttpUser):
         Choose a random segment and initialize the buffer.
         Used to simulate users jumping to different parts of a VOD stream.
         """
-        self.current_segment_index = random.randint(0, self.total_segments - 1)
+        # Abort downloads for the old position, like a player does on seek
+        self.fetch_pool.kill()
+        self.current_segment_index = self.rng.randint(0, self.total_segments - 1)
         self.buffered_duration = 0
-        self.segment_queue = Queue()
+        self.segment_queue.clear()
+        self.queued_uris.clear()
         self.last_downloaded_sequence = self.current_segment_index - 1
+        self.last_added_sequence = self.current_segment_index - 1
         logging.debug(f"Switching to random segment with index {self.current_segment_index}")
         # Fill buffer for VOD
         self.add_segments_to_queue_for_vod()
@@ -313,23 +589,31 @@ class HLSUser(FastHttpUser):
     def add_segments_to_queue_for_vod(self):
         """
         Add new segments to the queue for VOD to maintain the buffer.
-        Will add segments until the buffer duration is reached or all segments are used.
+        Continues after the last queued segment and keeps prefetch_window segments
+        queued beyond the buffer duration, so downloads never wait for a refill.
+        Will add segments until that target is reached or all segments are used.
         """
-        index = self.last_downloaded_sequence + 1
-        accumulated_duration = self.buffered_duration
+        start = self.last_added_sequence + 1
+        # Buffered, being downloaded and still queued segments all count towards the target
+        accumulated_duration = self.buffered_duration + self.pending_duration + sum(item[1] for item in self.segment_queue)
+        target_duration = self.buffer_duration + self.prefetch_window * self.average_segment_duration
+        if accumulated_duration >= target_duration or start >= self.total_segments:
+            return
 
-        while accumulated_duration < self.buffer_duration and index < self.total_segments:
-            ts_segment = self.playlist_segments[index]
-            ts_uri = ts_segment.uri
-            duration = ts_segment.duration
+        # Find the first segment that reaches the target with a binary search over
+        # the running totals, instead of summing durations segment by segment
+        offset = self.cumulative_durations[start - 1] if start > 0 else 0
+        end = bisect_left(self.cumulative_durations, offset + target_duration - accumulated_duration, start) + 1
+        end = min(end, self.total_segments)
 
-            # Add segment to queue
-            self.segment_queue.put((ts_uri, duration, index))
-            accumulated_duration += duration
-            index += 1
+        # Add segments to queue
+        new_segments = [(ts_uri, duration, index)
+                        for index, (ts_uri, duration) in enumerate(self.playlist_segments[start:end], start)]
+        self.segment_queue.extend(new_segments)
+        self.queued_uris.update(ts_uri for ts_uri, _, _ in new_segments)
 
         # Update last added segment
-        self.last_added_sequence = index - 1 if index > 0 else self.current_segment_index
+        self.last_added_sequence = end - 1
 
     def update_playback_position(self):
         """
@@ -340,15 +624,17 @@ class HLSUser(FastHttpUser):
         try:
             while self.running:
                 gevent.sleep(1)
-                with self.semaphore:
-                    self.playback_position += 1
-                    # Decrease buffer level by 1 second
-                    self.buffered_duration = max(0, self.buffered_duration - 1)
+                # Nothing here yields, so the counters can be updated without the semaphore
+                self.playback_position += 1
+                # Decrease buffer level by 1 second
+                self.buffered_duration = max(0, self.buffered_duration - 1)
+                if self.debug:
                     logging.debug(f"Playback position: {self.playback_position} sec, Buffer: {self.buffered_duration} sec")
 
-                    # For VOD, check if we've reached the end of the playlist
-                    if self.stream_type == 'VOD' and self.last_downloaded_sequence >= self.total_segments - 1 and self.buffered_duration == 0:
-                        logging.debug("End of VOD playlist reached, switching to random segment")
+                # For VOD, check if we've reached the end of the playlist
+                if self.stream_type == 'VOD' and self.last_downloaded_sequence >= self.total_segments - 1 and self.buffered_duration == 0:
+                    logging.debug("End of VOD playlist reached, switching to random segment")
+                    with self.semaphore:
                         self.switch_to_random_segment()
         except Exception as e:
             logging.error(f"Error in update_playback_position: {e}")
@@ -366,40 +652,33 @@ class HLSUser(FastHttpUser):
         try:
             while self.running:
                 gevent.sleep(5)  # Check for updates every 5 seconds
-                playlist_response = self.client.get(
-                    self.playlist_uri,
-                    name=f"GET stream.m3u8"
-                )
-                if playlist_response.status_code != 200:
-                    logging.error(f"Error getting playlist: status code {playlist_response.status_code}")
+                variant_playlist = self.fetch_variant_playlist()
+                if not variant_playlist:
                     continue
 
-                variant_playlist = m3u8.loads(playlist_response.text)
+                segments, media_sequence, _, _, _ = variant_playlist
 
                 with self.semaphore:
                     # Dynamically calculate buffer duration for LIVE streams
                     if self.buffer_duration == 0:
-                        total_playlist_duration = sum(segment.duration for segment in variant_playlist.segments)
+                        total_playlist_duration = sum(duration for _, duration in segments)
                         self.buffer_duration = total_playlist_duration / 2
                         logging.info(f"Calculated buffer set to {self.buffer_duration} sec")
 
-                    media_sequence = variant_playlist.media_sequence
-
                     if self.last_downloaded_sequence is None:
                         self.last_downloaded_sequence = media_sequence - 1
 
                     # Add new segments to the queue
-                    for index, ts_segment in enumerate(variant_playlist.segments):
+                    for index, (ts_uri, duration) in enumerate(segments):
                         segment_sequence = media_sequence + index
-                        ts_uri = ts_segment.uri
-                        duration = ts_segment.duration
 
                         if segment_sequence > self.last_downloaded_sequence:
                             # Skip if segment already in queue
-                            if ts_uri in [item[0] for item in self.segment_queue.queue]:
+                            if ts_uri in self.queued_uris:
                                 continue
 
-                            self.segment_queue.put((ts_uri, duration, segment_sequence))
+                            self.segment_queue.append((ts_uri, duration, segment_sequence))
+                            self.queued_uris.add(ts_uri)
                         else:
                             continue
         except Exception as e:
@@ -408,72 +687,174 @@ class HLSUser(FastHttpUser):
     def download_segments(self):
         """
         Download segments from the queue to maintain the buffer.
+        Starts fetchers in the fetch pool, so up to segment_fetch_concurrency
+        segments are downloaded in parallel.
         Works for both LIVE and VOD streams.
         """
         logging.debug("Started download_segments function")
         try:
             while self.running:
                 gevent.sleep(1)
+                idle = True
                 with self.semaphore:
+                    # Downloads in the pool keep changing the buffer level, read it once for this check.
+                    # Segments already being downloaded count towards the buffer
+                    buffered_duration = self.buffered_duration + self.pending_duration
                     # Check if buffer needs more segments
-                    if self.buffered_duration < self.buffer_duration:
-                        # For VOD, add new segments to the queue if it's empty
-                        if self.stream_type == 'VOD' and self.segment_queue.empty():
+                    if buffered_duration < self.buffer_duration:
+                        # For VOD, top up the queue before it runs dry
+                        if self.stream_type == 'VOD' and len(self.segment_queue) < self.prefetch_window:
                             self.add_segments_to_queue_for_vod()
 
-                        if not self.segment_queue.empty():
-                            ts_uri, duration, segment_sequence = self.segment_queue.get()
-
-                            # Add sessionid to TS URI if needed
-                            if self.sessionid and 'sessionid' not in ts_uri:
-                                parsed_ts_uri = urlparse(ts_uri)
-                                query_params = parse_qs(parsed_ts_uri.query)
-                                query_params['sessionid'] = self.sessionid
-                                new_query = urlencode(query_params, doseq=True)
-                                ts_uri = parsed_ts_uri._replace(query=new_query).geturl()
-
-                            # Convert relative path to full URL
-                            ts_url_full = urljoin(self.playlist_uri, ts_uri)
-
-                            # Check URL based on filter setting and download TS segment
-                            should_download = True
-                            if self.filter_host_segments and not ts_url_full.startswith(self.host):
-                                should_download = False
-                                logging.debug(f"Skipping segment with URL not matching host: {ts_url_full}")
-
-                            if should_download:
-                                logging.debug(f"Downloading TS segment: {ts_url_full}")
-
-                                # Prepare headers based on download mode
-                                headers = {}
-                                if not self.download_full_segments:
-                                    headers = {'Range': 'bytes=0-0'}
-                                    
-                                # Download segment
-                                ts_response = self.client.get(
-                                    ts_url_full,
-                                    headers=headers,
-                                    name=f"GET TS Segment"
-                                )
-
-                                # Increase buffer level by segment duration
-                                self.buffered_duration += duration
-                                # Update last downloaded segment
-                                self.last_downloaded_sequence = segment_sequence
-
-                                if ts_response.status_code in [200, 206]:
-                                    logging.debug(f"TS segment downloaded successfully: {ts_url_full}")
-                                else:
-                                    logging.error(f"Error downloading TS segment: status code {ts_response.status_code}")
-                            else:
-                                # Still update buffer and sequence even if we didn't download
-                                self.buffered_duration += duration
-                                self.last_downloaded_sequence = segment_sequence
-                        else:
-                            # Queue is empty, wait before next check
-                            gevent.sleep(1)
-                    else:
-                        # Buffer is full, wait before next check
-                        gevent.sleep(1)
+                        if self.segment_queue:
+                            # Start a fetcher for every free slot that has a segment to work on
+                            for _ in range(min(self.fetch_pool.free_count(), len(self.segment_queue))):
+                                self.fetch_pool.spawn(self.fetch_segments)
+                            idle = False
+                if idle:
+                    # Buffer is full or queue is empty, wait before next check
+                    # without holding the semaphore, so seeking is not delayed
+                    gevent.sleep(1)
         except Exception as e:
             logging.error(f"Error in download_segments: {e}")
+
+    def segment_url(self, ts_uri):
+        """
+        Build the full URL of a segment, adding the sessionid if needed.
+
+        Args:
+            ts_uri: Segment URI from the playlist
+
+        Returns:
+            Full segment URL
+        """
+        # Add sessionid to TS URI if needed
+        if self.sessionid_suffix and 'sessionid' not in ts_uri:
+            ts_uri = _append_query(ts_uri, self.sessionid_suffix)
+
+        # Convert relative path to full URL. Common forms are resolved against
+        # the precomputed playlist origin/directory, urljoin only handles the rest
+        # (dot segments, protocol-relative and query-only references)
+        if ts_uri.startswith(('http://', 'https://')):
+            return ts_uri
+        if ts_uri.startswith('/') and not ts_uri.startswith('//'):
+            return self.playlist_origin + ts_uri
+        if ts_uri.startswith(('/', '.', '?', '#')):
+            return urljoin(self.playlist_uri, ts_uri)
+        return self.playlist_base + ts_uri
+
+    def fetch_segments(self):
+        """
+        Download queued segments one after another while the buffer needs them.
+        Runs inside the fetch pool and moves on to the next segment as soon as
+        the previous one completes, instead of waiting for the next dispatch.
+        Segments being downloaded count towards the buffer, so parallel fetchers
+        don't overshoot it.
+        """
+        # Settings that don't change during playback, read once
+        host = self.host
+        filter_host_segments = self.filter_host_segments
+
+        while self.running and self.buffered_duration + self.pending_duration < self.buffer_duration and self.segment_queue:
+            ts_uri, duration, segment_sequence = self.segment_queue.popleft()
+
+            # Check URL based on filter setting, absolute URIs from other hosts
+            # are rejected before the full URL is built
+            if filter_host_segments and ts_uri.startswith(('http://', 'https://')) and not ts_uri.startswith(host):
+                ts_url_full = ts_uri
+                should_download = False
+            else:
+                ts_url_full = self.segment_url(ts_uri)
+                should_download = not filter_host_segments or ts_url_full.startswith(host)
+
+            if not should_download:
+                if self.debug:
+                    logging.debug(f"Skipping segment with URL not matching host: {ts_url_full}")
+                self.queued_uris.discard(ts_uri)
+                # Still update buffer and sequence even if we didn't download
+                self.buffered_duration += duration
+                self.last_downloaded_sequence = max(self.last_downloaded_sequence, segment_sequence)
+                continue
+
+            self.pending_duration += duration
+            try:
+                self.download_segment(ts_uri, ts_url_full, duration, segment_sequence)
+            finally:
+                self.pending_duration -= duration
+
+    def download_segment(self, ts_uri, ts_url_full, duration, segment_sequence):
+        """
+        Download a single TS segment and account for it in the buffer.
+        The segment URI stays in queued_uris until the download finishes,
+        so LIVE refreshes don't queue it again.
+
+        Args:
+            ts_uri: Segment URI as queued from the playlist
+            ts_url_full: Full URL of the segment
+            duration: Segment duration in seconds
+            segment_sequence: Sequence number of the segment
+        """
+        try:
+            if self.debug:
+                logging.debug(f"Downloading TS segment: {ts_url_full}")
+
+            # Download segment
+            if self.download_full_segments:
+                ts_response = self.stream_segment(ts_url_full)
+            else:
+                ts_response = self.client.get(
+                    ts_url_full,
+                    headers=self.segment_headers,
+                    name=f"GET TS Segment"
+                )
+
+            # Increase buffer level by segment duration
+            self.buffered_duration += duration
+            # Update last downloaded segment, parallel downloads may complete out of order
+            self.last_downloaded_sequence = max(self.last_downloaded_sequence, segment_sequence)
+
+            if ts_response.status_code in [200, 206]:
+                if self.debug:
+                    logging.debug(f"TS segment downloaded successfully: {ts_url_full}")
+            else:
+                logging.error(f"Error downloading TS segment: status code {ts_response.status_code}")
+        except Exception as e:
+            logging.error(f"Error in download_segment: {e}")
+        finally:
+            self.queued_uris.discard(ts_uri)
+
+    def stream_segment(self, ts_url_full):
+        """
+        Download a full TS segment without keeping its content in memory.
+        The body is read in fixed-size chunks that are dropped right away.
+        The response time and size reported to Locust include the whole body.
+
+        Args:
+            ts_url_full: Full URL of the segment
+
+        Returns:
+            The segment response
+        """
+        with self.client.get(
+            ts_url_full,
+            headers=self.segment_headers,
+            name=f"GET TS Segment",
+            stream=True,
+            catch_response=True
+        ) as ts_response:
+            # Status code is 0 if the request failed before a response arrived
+            if ts_response.status_code:
+                read_start = time.perf_counter()
+                response_length = 0
+                try:
+                    chunk = ts_response.stream.read(_SEGMENT_READ_CHUNK_SIZE)
+                    while chunk:
+                        response_length += len(chunk)
+                        chunk = ts_response.stream.read(_SEGMENT_READ_CHUNK_SIZE)
+                except Exception as e:
+                    ts_response.failure(e)
+                finally:
+                    ts_response.release()
+                ts_response.request_meta['response_length'] = response_length
+                ts_response.request_meta['response_time'] += (time.perf_counter() - read_start) * 1000
+        return ts_response